@@ -0,0 +1,117 @@
+import base64
+import json
+import os
+import sys
+from array import array
+from collections import defaultdict
+
+import tornado.web
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+
+class DensityGrid(VisualizationElement):
+    """Level-of-detail replacement for CanvasGrid.
+
+    The browser zooms with the mouse wheel (double-click resets) and reports
+    the visible window back to the server. While the window holds at most
+    detail_cells cells every agent is drawn with portrayal_method, exactly like
+    CanvasGrid, hover tooltips included. Larger windows are sent as
+    per-species counts aggregated into blocks of cells and packed as base64
+    uint16 arrays, which the browser draws as a heatmap, so the payload stays
+    small however many agents there are.
+    """
+
+    package_includes = ["GridDraw.js", "InteractionHandler.js"]
+    local_includes = ["DensityModule.js"]
+    local_dir = os.path.dirname(os.path.abspath(__file__))
+
+    def __init__(self, portrayal_method, grid_width, grid_height, canvas_width=500,
+                 canvas_height=500, species_colors=None, detail_cells=4000, max_blocks=20000):
+        super().__init__()
+        self.portrayal_method = portrayal_method
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        # agent class name -> heatmap colour
+        self.species_colors = species_colors or {}
+        self.detail_cells = detail_cells
+        self.max_blocks = max_blocks
+        self.viewport = (0, 0, grid_width, grid_height)
+        self.js_code = "elements.push(new DensityModule({}, {}, {}, {}));".format(
+            canvas_width, canvas_height, grid_width, grid_height)
+
+    def install(self, server):
+        # the browser posts its zoomed window here
+        server.add_handlers(r".*", [(r"/density_viewport", ViewportHandler, {"element": self})])
+        return server
+
+    def set_viewport(self, x, y, w, h):
+        w = min(max(int(w), 1), self.grid_width)
+        h = min(max(int(h), 1), self.grid_height)
+        x = min(max(int(x), 0), self.grid_width - w)
+        y = min(max(int(y), 0), self.grid_height - h)
+        self.viewport = (x, y, w, h)
+
+    def render(self, model):
+        x0, y0, w, h = self.viewport
+        if w * h <= self.detail_cells:
+            return {"mode": "detail", "view": self.viewport, "layers": self.render_detail(model)}
+        return self.render_density(model)
+
+    def render_detail(self, model):
+        x0, y0, w, h = self.viewport
+        grid_state = defaultdict(list)
+        for x in range(x0, x0 + w):
+            for y in range(y0, y0 + h):
+                for obj in model.grid.get_cell_list_contents([(x, y)]):
+                    portrayal = self.portrayal_method(obj)
+                    if portrayal:
+                        portrayal["x"] = x - x0
+                        portrayal["y"] = y - y0
+                        grid_state[portrayal["Layer"]].append(portrayal)
+        return grid_state
+
+    def render_density(self, model):
+        x0, y0, w, h = self.viewport
+        # smallest square block that keeps the heatmap within max_blocks
+        block = 1
+        while -(-w // block) * -(-h // block) > self.max_blocks:
+            block += 1
+        cols, rows = -(-w // block), -(-h // block)
+        counts = {}
+        for agent in model.schedule.agents:
+            if agent.pos is None:
+                continue
+            x, y = agent.pos
+            if not (x0 <= x < x0 + w and y0 <= y < y0 + h):
+                continue
+            name = type(agent).__name__
+            if name not in self.species_colors:
+                continue
+            if name not in counts:
+                counts[name] = [0] * (cols * rows)
+            counts[name][(y - y0) // block * cols + (x - x0) // block] += 1
+
+        species = []
+        for name, values in counts.items():
+            packed = array("H", (min(v, 65535) for v in values))
+            if sys.byteorder == "big":
+                packed.byteswap()  # the browser reads little-endian
+            species.append({"name": name,
+                            "color": self.species_colors[name],
+                            "max": max(values),
+                            "counts": base64.b64encode(packed.tobytes()).decode("ascii")})
+        return {"mode": "density", "view": self.viewport, "block": block,
+                "cols": cols, "rows": rows, "species": species}
+
+
+class ViewportHandler(tornado.web.RequestHandler):
+    def initialize(self, element):
+        self.element = element
+
+    def post(self):
+        view = json.loads(self.request.body)
+        self.element.set_viewport(view["x"], view["y"], view["w"], view["h"])
+        # answer with the new window straight away, even while paused
+        self.write(self.element.render(self.application.model))
@@ -0,0 +1,147 @@
+// Browser side of Density.DensityGrid: draws either the usual agent
+// portrayals (through GridDraw.js) or a per-species density heatmap, and
+// zooms with the mouse wheel. The visible window is posted to the server,
+// which answers with a fresh render of that window. In detail mode an
+// InteractionHandler on a second canvas shows agent tooltips, as CanvasModule
+// does.
+const DensityModule = function (canvas_width, canvas_height, grid_width, grid_height) {
+  const parent = document.createElement("div");
+  parent.style.height = `${canvas_height}px`;
+  parent.className = "world-grid-parent";
+  const createCanvas = () => {
+    const el = document.createElement("canvas");
+    el.width = canvas_width;
+    el.height = canvas_height;
+    el.className = "world-grid";
+    return el;
+  };
+  const canvas = createCanvas();
+  parent.appendChild(canvas);
+  let interaction_canvas = createCanvas();
+  parent.appendChild(interaction_canvas);
+  document.getElementById("elements").appendChild(parent);
+  const context = canvas.getContext("2d");
+
+  // the handler's lookup table is sized to the window, so it is rebuilt when
+  // the window changes; a fresh overlay drops the old handler's listener
+  let interactionHandler = null;
+  let interactionSize = null;
+  const resetInteraction = (w, h) => {
+    const size = w === null ? null : `${w}x${h}`;
+    if (size === interactionSize) return;
+    const fresh = createCanvas();
+    parent.replaceChild(fresh, interaction_canvas);
+    interaction_canvas = fresh;
+    interactionSize = size;
+    interactionHandler = w === null ? null : new InteractionHandler(
+      canvas_width, canvas_height, w, h, interaction_canvas.getContext("2d"));
+  };
+
+  const full = { x: 0, y: 0, w: grid_width, h: grid_height };
+  let view = full;
+
+  const render = (data) => {
+    context.clearRect(0, 0, canvas_width, canvas_height);
+    context.beginPath();
+    if (data.mode === "density") {
+      resetInteraction(null);
+      drawDensity(data);
+    } else drawDetail(data);
+  };
+
+  const drawDetail = (data) => {
+    const [, , w, h] = data.view;
+    resetInteraction(w, h);
+    const draw = new GridVisualization(canvas_width, canvas_height, w, h, context,
+      interactionHandler);
+    for (const layer in data.layers) draw.drawLayer(data.layers[layer]);
+    draw.drawGridLines("#eee");
+  };
+
+  const decode = (text) => {
+    const bytes = Uint8Array.from(atob(text), (c) => c.charCodeAt(0));
+    return new Uint16Array(bytes.buffer);
+  };
+
+  const rgb = (color) => {
+    context.fillStyle = color; // let the canvas parse any CSS colour
+    const hex = context.fillStyle;
+    return [1, 3, 5].map((i) => parseInt(hex.slice(i, i + 2), 16));
+  };
+
+  const drawDensity = (data) => {
+    const { cols, rows } = data;
+    const image = context.createImageData(cols, rows);
+    const pixels = image.data;
+    for (const species of data.species) {
+      const counts = decode(species.counts);
+      const [r, g, b] = rgb(species.color);
+      const scale = Math.log1p(species.max);
+      for (let row = 0; row < rows; row++) {
+        // grid y grows upwards, canvas rows downwards
+        const out = (rows - 1 - row) * cols;
+        for (let col = 0; col < cols; col++) {
+          const n = counts[row * cols + col];
+          if (!n) continue;
+          const alpha = Math.log1p(n) / scale;
+          const p = (out + col) * 4;
+          pixels[p] = Math.min(255, pixels[p] + r * alpha);
+          pixels[p + 1] = Math.min(255, pixels[p + 1] + g * alpha);
+          pixels[p + 2] = Math.min(255, pixels[p + 2] + b * alpha);
+          pixels[p + 3] = 255;
+        }
+      }
+    }
+    const offscreen = document.createElement("canvas");
+    offscreen.width = cols;
+    offscreen.height = rows;
+    offscreen.getContext("2d").putImageData(image, 0, 0);
+    context.imageSmoothingEnabled = false;
+    // the last block may be partial, so scale by cells rather than blocks
+    const [, , w, h] = data.view;
+    const cw = canvas_width / w;
+    const ch = canvas_height / h;
+    const bw = cols * data.block * cw;
+    const bh = rows * data.block * ch;
+    context.drawImage(offscreen, 0, canvas_height - bh, bw, bh);
+  };
+
+  const sendView = () => {
+    fetch("/density_viewport", { method: "POST", body: JSON.stringify(view) })
+      .then((response) => response.json())
+      .then(render);
+  };
+
+  // the overlay sits on top of the canvas, so listen on the parent
+  parent.addEventListener("wheel", (event) => {
+    event.preventDefault();
+    const rect = canvas.getBoundingClientRect();
+    const fx = (event.clientX - rect.left) / rect.width;
+    const fy = 1 - (event.clientY - rect.top) / rect.height;
+    const factor = event.deltaY < 0 ? 0.5 : 2;
+    const w = Math.min(grid_width, Math.max(1, Math.round(view.w * factor)));
+    const h = Math.min(grid_height, Math.max(1, Math.round(view.h * factor)));
+    // keep the cell under the cursor in place
+    const cx = view.x + fx * view.w;
+    const cy = view.y + fy * view.h;
+    view = {
+      x: Math.min(grid_width - w, Math.max(0, Math.round(cx - fx * w))),
+      y: Math.min(grid_height - h, Math.max(0, Math.round(cy - fy * h))),
+      w: w,
+      h: h,
+    };
+    sendView();
+  });
+
+  parent.addEventListener("dblclick", () => {
+    view = full;
+    sendView();
+  });
+
+  this.render = render;
+
+  this.reset = () => {
+    context.clearRect(0, 0, canvas_width, canvas_height);
+    resetInteraction(null);
+  };
+};
@@ -0,0 +1,92 @@
+from collections import deque
+
+
+class EarlyStopping:
+    """Online extinction / steady-state / cycle detector for EcosystemModel.
+
+    Call update(model) after every datacollector.collect(). It reads the latest
+    values of the population series, and once the run has gone extinct, settled
+    down or locked into a predator-prey cycle it sets model.running = False and
+    records why in model.stop_reason.
+    """
+
+    def __init__(self, series=("Spiders", "Prey", "Lights"), extinct=("Spiders", "Prey"),
+                 window=60, tolerance=0.02, acf_threshold=0.8, min_period=4):
+        self.series = series
+        self.extinct = extinct
+        self.window = window
+        self.tolerance = tolerance
+        self.acf_threshold = acf_threshold
+        self.min_period = min_period
+        self.history = {name: deque(maxlen=window) for name in series}
+        self.reason = None
+        self.stopped_at = None
+
+    def update(self, model):
+        if self.reason is not None:
+            return self.reason
+        model_vars = model.datacollector.model_vars
+        for name in self.series:
+            if model_vars.get(name):
+                self.history[name].append(model_vars[name][-1])
+        reason = self.check()
+        if reason is not None:
+            self.reason = reason
+            self.stopped_at = model.schedule.steps
+            model.stop_reason = reason
+            model.running = False
+        return reason
+
+    def check(self):
+        for name in self.extinct:
+            values = self.history.get(name)
+            if values and values[-1] == 0:
+                return f"extinction: {name}"
+        tracked = [values for values in self.history.values() if values]
+        if not tracked or len(tracked[0]) < self.window:
+            return None
+        if all(self._stationary(values) for values in tracked):
+            return "steady state"
+        periods = [self._period(values) for values in tracked if not self._stationary(values)]
+        if periods and all(periods):
+            return f"cycle: period {max(periods)}"
+        return None
+
+    def _stationary(self, values):
+        # flat enough, and no drift between the two halves of the window
+        half = len(values) // 2
+        values = list(values)
+        scale = max(abs(mean(values)), 1)
+        drift = abs(mean(values[:half]) - mean(values[half:]))
+        return std(values) / scale < self.tolerance and drift / scale < self.tolerance
+
+    def _period(self, values):
+        # first autocorrelation peak above the threshold, with at least two
+        # full periods inside the window
+        values = list(values)
+        acf = autocorrelation(values, len(values) // 2)
+        for lag in range(self.min_period, len(acf) - 1):
+            if acf[lag] >= self.acf_threshold and acf[lag - 1] <= acf[lag] >= acf[lag + 1]:
+                return lag
+        return None
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def std(values):
+    m = mean(values)
+    return (sum((v - m) ** 2 for v in values) / len(values)) ** 0.5
+
+
+def autocorrelation(values, max_lag):
+    n = len(values)
+    m = mean(values)
+    centred = [v - m for v in values]
+    var = sum(c * c for c in centred)
+    if var == 0:
+        return [1.0] + [0.0] * max_lag
+    # normalised by the overlap length, so a clean cycle scores close to 1
+    return [sum(centred[i] * centred[i + lag] for i in range(n - lag)) / var * n / (n - lag)
+            for lag in range(max_lag + 1)]
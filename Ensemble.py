@@ -0,0 +1,241 @@
+"""Ensemble runs through a SQLite work queue on shared storage.
+
+A coordinator enqueues run specs; workers on any machine that can see the
+queue file claim jobs under a lease, run each one in a child process, and
+publish its results directory with an atomic rename. A job whose worker dies
+or stops renewing its lease is picked up again once the lease expires, and
+failed or timed-out runs are retried up to max_attempts times.
+
+    python3 Ensemble.py enqueue runs.db --variant update --steps 200 --seeds 0-49
+    python3 Ensemble.py worker runs.db --results results/   # on every node
+    python3 Ensemble.py local runs.db --results results/ --workers 4
+    python3 Ensemble.py status runs.db
+
+SQLite locking needs a shared filesystem with working POSIX locks.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+import Run
+
+schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT
+)
+"""
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.execute(schema)
+    return conn
+
+
+def enqueue(path, specs):
+    conn = connect(path)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT INTO jobs (spec) VALUES (?)",
+                         [(json.dumps(spec, sort_keys=True),) for spec in specs])
+    conn.close()
+
+
+def status(path):
+    conn = connect(path)
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+    conn.close()
+    return counts
+
+
+def run_job(spec, out_dir):
+    model, params = Run.run(spec["variant"], spec["steps"], seed=spec.get("seed"),
+                            params=spec.get("params"), early_stop=spec.get("early_stop", False))
+    summary = Run.summarize(model, spec["variant"], params, spec.get("seed"), spec["steps"])
+    Run.write_results(model.datacollector.model_vars, out_dir, summary)
+
+
+class Worker:
+    def __init__(self, path, results, lease=60, timeout=None, max_attempts=3, poll=2):
+        self.path = path
+        self.results = results
+        self.lease = lease
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.poll = poll
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.conn = connect(path)
+        os.makedirs(results, exist_ok=True)
+
+    def claim(self):
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # a running job whose lease ran out belongs to a dead or stuck worker
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired' "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts))
+            row = self.conn.execute(
+                "SELECT id, spec FROM jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND lease_until < ?) ORDER BY id LIMIT 1",
+                (now,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (self.name, now + self.lease, row[0]))
+        return row[0], json.loads(row[1])
+
+    def renew(self, job_id, stop):
+        conn = None
+        wait = self.lease / 3
+        while not stop.wait(wait):
+            try:
+                if conn is None:
+                    conn = connect(self.path)
+                conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ?",
+                             (time.time() + self.lease, job_id, self.name))
+            except sqlite3.OperationalError:
+                # busy past the connection timeout; retry well before the lease runs out
+                wait = min(1.0, self.lease / 10)
+            else:
+                wait = self.lease / 3
+        if conn is not None:
+            conn.close()
+
+    def finish(self, job_id, error=None):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # a job whose lease lapsed may have been reclaimed by another worker
+            if error is None:
+                self.conn.execute("UPDATE jobs SET status = 'done', error = NULL "
+                                  "WHERE id = ? AND worker = ?", (job_id, self.name))
+            else:
+                self.conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' "
+                    "ELSE 'pending' END, error = ?, lease_until = NULL "
+                    "WHERE id = ? AND worker = ?",
+                    (self.max_attempts, error, job_id, self.name))
+
+    def process(self, job_id, spec):
+        final = os.path.join(self.results, f"job-{job_id}")
+        tmp = f"{final}.{self.name.replace(':', '-')}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        stop = threading.Event()
+        try:
+            # a child process can be killed on timeout and cannot take the worker down
+            child = multiprocessing.Process(target=run_job, args=(spec, tmp))
+            child.start()
+            threading.Thread(target=self.renew, args=(job_id, stop), daemon=True).start()
+            child.join(self.timeout)
+            if child.is_alive():
+                child.terminate()
+                child.join()
+                raise TimeoutError(f"run exceeded {self.timeout}s")
+            if child.exitcode != 0:
+                raise RuntimeError(f"run exited with code {child.exitcode}")
+            try:
+                os.rename(tmp, final)  # publish atomically
+            except OSError:
+                if not os.path.isdir(final):
+                    raise
+                shutil.rmtree(tmp)  # another worker already published it
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            self.finish(job_id, traceback.format_exc(limit=3))
+        else:
+            self.finish(job_id)
+        finally:
+            stop.set()
+
+    def work(self, exit_when_empty=False):
+        while True:
+            job = self.claim()
+            if job is None:
+                if exit_when_empty and not status(self.path).get("running"):
+                    return
+                time.sleep(self.poll)
+                continue
+            self.process(*job)
+
+
+def work(path, results, **options):
+    Worker(path, results, **options).work(exit_when_empty=True)
+
+
+def parse_seeds(text):
+    seeds = []
+    for part in text.split(","):
+        first, sep, last = part.partition("-")
+        seeds.extend(range(int(first), int(last) + 1) if sep else [int(first)])
+    return seeds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run EcosystemModel ensembles through a shared queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("enqueue", help="add one job per seed")
+    add.add_argument("queue")
+    add.add_argument("--variant", choices=sorted(Run.variants), required=True)
+    add.add_argument("--steps", type=int, default=100)
+    add.add_argument("--seeds", type=parse_seeds, default=[0], help="e.g. 0-9 or 1,5,7")
+    add.add_argument("--param", type=Run.parse_param, action="append", default=[],
+                     metavar="NAME=VALUE")
+    add.add_argument("--early-stop", action="store_true")
+
+    for name in ("worker", "local"):
+        command = commands.add_parser(name, help="claim and run jobs" if name == "worker"
+                                      else "run several workers here until the queue is empty")
+        command.add_argument("queue")
+        command.add_argument("--results", default="results")
+        command.add_argument("--lease", type=float, default=60, help="seconds, renewed while running")
+        command.add_argument("--timeout", type=float, default=None, help="seconds per run")
+        command.add_argument("--max-attempts", type=int, default=3)
+        if name == "local":
+            command.add_argument("--workers", type=int, default=os.cpu_count())
+        else:
+            command.add_argument("--exit-when-empty", action="store_true")
+
+    show = commands.add_parser("status", help="count jobs by status")
+    show.add_argument("queue")
+    args = parser.parse_args(argv)
+
+    if args.command == "enqueue":
+        enqueue(args.queue, [{"variant": args.variant, "steps": args.steps, "seed": seed,
+                              "params": dict(args.param), "early_stop": args.early_stop}
+                             for seed in args.seeds])
+    elif args.command == "status":
+        print(json.dumps(status(args.queue)))
+    else:
+        options = dict(lease=args.lease, timeout=args.timeout, max_attempts=args.max_attempts)
+        if args.command == "worker":
+            Worker(args.queue, args.results, **options).work(args.exit_when_empty)
+        else:
+            workers = [multiprocessing.Process(target=work, args=(args.queue, args.results),
+                                               kwargs=options)
+                       for _i in range(args.workers)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            print(json.dumps(status(args.queue)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import math
+from collections import deque
+
+from Detectors import autocorrelation, mean, std
+
+
+class RecursiveLeastSquares:
+    """Two-parameter fit of y = theta0 + theta1 * x with exponential forgetting."""
+
+    def __init__(self, forgetting=0.99, scale=1e4):
+        self.forgetting = forgetting
+        self.theta = [0.0, 0.0]
+        self.P = [[scale, 0.0], [0.0, scale]]
+
+    def update(self, x, y):
+        lam = self.forgetting
+        P = self.P
+        # P @ phi with phi = (1, x)
+        Pphi = [P[0][0] + P[0][1] * x, P[1][0] + P[1][1] * x]
+        denom = lam + Pphi[0] + Pphi[1] * x
+        gain = [Pphi[0] / denom, Pphi[1] / denom]
+        error = y - (self.theta[0] + self.theta[1] * x)
+        self.theta = [self.theta[0] + gain[0] * error, self.theta[1] + gain[1] * error]
+        # P = (P - gain phi^T P) / lam; phi^T P == Pphi^T since P is symmetric
+        self.P = [[(P[i][j] - gain[i] * Pphi[j]) / lam for j in range(2)] for i in range(2)]
+
+
+class OnlineLotkaVolterra:
+    """Online Lotka-Volterra fit of the Prey/Spiders series.
+
+    Call update(model) after every datacollector.collect() (add it to
+    model.monitors). Each new pair of counts feeds two recursive least-squares
+    fits of the discrete log growth rates
+
+        ln(P[t+1] / P[t]) = alpha - beta * S[t]
+        ln(S[t+1] / S[t]) = -gamma + delta * P[t]
+
+    so the estimates track the run without a second pass over stored data. The
+    latest estimates, with the period implied by the fit, the period seen in the
+    prey series and the lag of spiders behind prey over a sliding window, are
+    kept in model.dynamics. The observed period and lag are None unless their
+    correlation reaches acf_threshold, so noise does not pass for a cycle.
+    """
+
+    def __init__(self, prey="Prey", predators="Spiders", forgetting=0.99, window=64,
+                 acf_threshold=0.6):
+        self.prey_name = prey
+        self.predator_name = predators
+        self.prey_fit = RecursiveLeastSquares(forgetting)
+        self.predator_fit = RecursiveLeastSquares(forgetting)
+        self.prey = deque(maxlen=window)
+        self.predators = deque(maxlen=window)
+        self.acf_threshold = acf_threshold
+        self.samples = 0
+
+    def update(self, model):
+        model_vars = model.datacollector.model_vars
+        if not model_vars.get(self.prey_name) or not model_vars.get(self.predator_name):
+            return None
+        self.observe(model_vars[self.prey_name][-1], model_vars[self.predator_name][-1])
+        model.dynamics = self.estimates()
+        return model.dynamics
+
+    def observe(self, prey, predators):
+        if self.prey and min(prey, predators, self.prey[-1], self.predators[-1]) > 0:
+            last_prey, last_predators = self.prey[-1], self.predators[-1]
+            self.prey_fit.update(last_predators, math.log(prey / last_prey))
+            self.predator_fit.update(last_prey, math.log(predators / last_predators))
+            self.samples += 1
+        self.prey.append(prey)
+        self.predators.append(predators)
+
+    def estimates(self):
+        alpha, minus_beta = self.prey_fit.theta
+        minus_gamma, delta = self.predator_fit.theta
+        beta, gamma = -minus_beta, -minus_gamma
+        period = None
+        if alpha > 0 and gamma > 0:
+            # small oscillations around the coexistence equilibrium
+            period = 2 * math.pi / math.sqrt(alpha * gamma)
+        return {
+            "alpha": alpha,
+            "beta": beta,
+            "gamma": gamma,
+            "delta": delta,
+            "prey_equilibrium": gamma / delta if delta else None,
+            "predator_equilibrium": alpha / beta if beta else None,
+            "period": period,
+            "observed_period": self.observed_period(),
+            "phase_lag": self.phase_lag(),
+            "samples": self.samples,
+        }
+
+    def observed_period(self):
+        # first autocorrelation peak of the prey window
+        acf = autocorrelation(list(self.prey), len(self.prey) // 2)
+        for lag in range(2, len(acf) - 1):
+            if acf[lag] >= self.acf_threshold and acf[lag - 1] <= acf[lag] >= acf[lag + 1]:
+                return lag
+        return None
+
+    def phase_lag(self):
+        # steps by which spiders trail prey: the first cross-correlation peak
+        # over the window
+        prey, predators = list(self.prey), list(self.predators)
+        n = len(prey)
+        if n < 4:
+            return None
+        scale = std(prey) * std(predators)
+        if scale == 0:
+            return None
+        prey_mean, predator_mean = mean(prey), mean(predators)
+        corr = [sum((prey[i] - prey_mean) * (predators[i + lag] - predator_mean)
+                    for i in range(n - lag)) / (n - lag) / scale
+                for lag in range(n // 2)]
+        for lag in range(len(corr) - 1):
+            if corr[lag] >= self.acf_threshold and corr[lag] >= corr[lag + 1] and (
+                    lag == 0 or corr[lag - 1] <= corr[lag]):
+                return lag
+        return None
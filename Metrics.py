@@ -0,0 +1,184 @@
+"""Live operational metrics for a running EcosystemModel.
+
+    metrics = MetricsExporter()
+    metrics.attach(model)
+    metrics.serve(9100)                    # http://127.0.0.1:9100/metrics
+    metrics.dump_every("metrics.prom", 10)  # or a file rewritten every 10 s
+
+Everything is published in the Prometheus text format.
+"""
+import gc
+import os
+import resource
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MetricsExporter:
+    def __init__(self, rate_window=50):
+        self.lock = threading.Lock()
+        self.steps_total = 0
+        self.step_seconds = 0.0
+        self.step_seconds_total = 0.0
+        self.last_step_time = None
+        self.step_times = deque(maxlen=rate_window)  # end times of recent steps
+        self.population = {}
+        self.species = set()  # every species seen, so extinct ones read 0
+        self.births = 0
+        self.deaths = 0
+        self.births_total = 0
+        self.deaths_total = 0
+        self.gc_pause_total = 0.0
+        self.gc_collections = Counter()
+        self._gc_start = None
+        self._threads = []
+        self._server = None
+        gc.callbacks.append(self._on_gc)
+
+    def attach(self, model):
+        with self.lock:
+            self.species.update(type(agent).__name__ for agent in model.schedule.agents)
+        step = model.step
+
+        def timed_step():
+            agents_before = model.schedule.get_agent_count()
+            ids_before = model.current_id
+            start = time.perf_counter()
+            step()
+            self.record(model, time.perf_counter() - start, agents_before, ids_before)
+
+        # instance attribute, so only this model is timed; ModularServer builds
+        # a new model on reset, which has to be attached again
+        model.step = timed_step
+        return model
+
+    def record(self, model, seconds, agents_before, ids_before):
+        population = Counter(type(agent).__name__ for agent in model.schedule.agents)
+        # new agents draw their ids from model.next_id()
+        births = model.current_id - ids_before
+        deaths = births - (sum(population.values()) - agents_before)
+        with self.lock:
+            self.steps_total += 1
+            self.step_seconds = seconds
+            self.step_seconds_total += seconds
+            self.last_step_time = time.time()
+            self.step_times.append(time.perf_counter())
+            self.species.update(population)
+            self.population = {name: population[name] for name in self.species}
+            self.births, self.deaths = births, deaths
+            self.births_total += births
+            self.deaths_total += deaths
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            self.gc_pause_total += time.perf_counter() - self._gc_start
+            self.gc_collections[info["generation"]] += 1
+            self._gc_start = None
+
+    def steps_per_second(self):
+        times = self.step_times
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        with self.lock:
+            metric("ecosystem_steps_total", "counter", "Model steps completed.",
+                   [("", self.steps_total)])
+            metric("ecosystem_steps_per_second", "gauge", "Step rate over the recent window.",
+                   [("", self.steps_per_second())])
+            metric("ecosystem_step_seconds", "gauge", "Wall time of the last step.",
+                   [("", self.step_seconds)])
+            metric("ecosystem_step_seconds_total", "counter", "Wall time spent stepping.",
+                   [("", self.step_seconds_total)])
+            if self.last_step_time is not None:
+                metric("ecosystem_last_step_timestamp_seconds", "gauge",
+                       "Unix time the last step finished.", [("", self.last_step_time)])
+            metric("ecosystem_population", "gauge", "Agents alive, per species.",
+                   [(f'{{species="{name}"}}', count) for name, count in sorted(self.population.items())])
+            metric("ecosystem_births", "gauge", "Agents created during the last step.",
+                   [("", self.births)])
+            metric("ecosystem_deaths", "gauge", "Agents removed during the last step.",
+                   [("", self.deaths)])
+            metric("ecosystem_births_total", "counter", "Agents created.", [("", self.births_total)])
+            metric("ecosystem_deaths_total", "counter", "Agents removed.", [("", self.deaths_total)])
+        metric("process_resident_memory_bytes", "gauge", "Resident set size.", [("", rss_bytes())])
+        metric("python_gc_pause_seconds_total", "counter", "Time spent in garbage collection.",
+               [("", self.gc_pause_total)])
+        metric("python_gc_collections_total", "counter", "Garbage collections, per generation.",
+               [(f'{{generation="{gen}"}}', n) for gen, n in sorted(self.gc_collections.items())])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the console
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._start(self._server.serve_forever)
+        return self._server.server_address[1]
+
+    def dump(self, path):
+        # write then rename, so readers never see a half-written file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def dump_every(self, path, interval):
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.dump(path)
+
+        self._start(loop, stop)
+
+    def _start(self, target, stop=None):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append((thread, stop))
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for _thread, stop in self._threads:
+            if stop is not None:
+                stop.set()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # no procfs: fall back to the peak, which ru_maxrss reports in kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -1,17 +1,10 @@
 import networkx as nx
-import time, enum, math
-import numpy as np
-import pandas as pd
-import pylab as plt
-import matplotlib.pyplot as plt
-import networkx as nx
-import panel as pn
-from matplotlib.colors import ListedColormap, LinearSegmentedColormap
-from panel import widgets as pnw
 from mesa import Agent, Model
 from mesa.datacollection import DataCollector
 from mesa.space import NetworkGrid
 from mesa.time import RandomActivation
+from Detectors import EarlyStopping
+from Fitting import OnlineLotkaVolterra
 
 
 class Spider(Agent):
@@ -127,6 +120,69 @@ class Environment(NetworkGrid):
             return True  # Return True if pos is None
 
 
+class DynamicNetworkGrid(NetworkGrid):
+    """NetworkGrid whose edges can be added and removed while the model runs.
+
+    Neighbour lists and degrees are kept in an index that is patched in O(1) on
+    every edge change (swap-remove), so rewiring never rebuilds anything and a
+    random neighbour can be drawn without copying the adjacency.
+    """
+
+    def __init__(self, G):
+        super().__init__(G)
+        self._nbrs = {node: list(G.neighbors(node)) for node in G.nodes}
+        self._slot = {node: {nbr: i for i, nbr in enumerate(nbrs)}
+                      for node, nbrs in self._nbrs.items()}
+        self.num_edges = G.number_of_edges()
+
+    def has_edge(self, u, v):
+        return v in self._slot[u]
+
+    def degree(self, node):
+        return len(self._nbrs[node])
+
+    def neighbors(self, node):
+        return self._nbrs[node]
+
+    def random_neighbor(self, node, rng):
+        nbrs = self._nbrs[node]
+        if not nbrs:
+            return None
+        return nbrs[int(rng.random() * len(nbrs))]
+
+    def add_edge(self, u, v):
+        if u == v or self.has_edge(u, v):
+            return False
+        for a, b in ((u, v), (v, u)):
+            self._slot[a][b] = len(self._nbrs[a])
+            self._nbrs[a].append(b)
+        self.G.add_edge(u, v)
+        self.num_edges += 1
+        return True
+
+    def remove_edge(self, u, v):
+        if not self.has_edge(u, v):
+            return False
+        for a, b in ((u, v), (v, u)):
+            nbrs, slot = self._nbrs[a], self._slot[a]
+            i = slot.pop(b)
+            last = nbrs.pop()
+            if last != b:
+                nbrs[i] = last
+                slot[last] = i
+        self.G.remove_edge(u, v)
+        self.num_edges -= 1
+        return True
+
+    def get_neighborhood(self, node_id, include_center=False, radius=1):
+        if radius != 1:
+            return super().get_neighborhood(node_id, include_center, radius)
+        neighborhood = list(self._nbrs[node_id])
+        if include_center:
+            neighborhood.append(node_id)
+        return sorted(neighborhood)
+
+
 class EcosystemModel(Model):
   grid = None
   def __init__(
@@ -142,8 +198,14 @@ class EcosystemModel(Model):
         height,
         steps,
         delay,
-        layout
+        layout,
+        early_stop=False,
+        fit_dynamics=False,
+        dynamic=False,
+        rewire_rate=0.1,
+        seed=None
     ):
+        # seed is consumed by mesa's Model.__new__ to seed self.random
         super().__init__()
         self.schedule = RandomActivation(self)
 
@@ -158,11 +220,24 @@ class EcosystemModel(Model):
         self.delay = delay
         self.layout = layout
 
-        self.G = nx.erdos_renyi_graph(n=self.num_spiders + self.num_prey + self.num_lights, p=0.2)
-        self.grid = NetworkGrid(self.G)
+        self.G = nx.erdos_renyi_graph(n=self.num_spiders + self.num_prey + self.num_lights, p=0.2, seed=self.random)
+        self.dynamic = dynamic
+        self.rewire_rate = rewire_rate
+        if dynamic:
+            # edges follow predation and light proximity, see rewire()
+            self.grid = DynamicNetworkGrid(self.G)
+        else:
+            self.grid = NetworkGrid(self.G)
         self.datacollector = DataCollector(model_reporters = {"Spiders": self.count_spiders, "Prey": self.count_prey, "Lights": self.count_lights})
 
         self.running = True
+        self.stop_reason = None
+        self.dynamics = None
+        self.monitors = []
+        if fit_dynamics:
+            self.monitors.append(OnlineLotkaVolterra())
+        if early_stop:
+            self.monitors.append(EarlyStopping(series=("Spiders", "Prey", "Lights")))
 
         self.spiders_count = 0
         # Create agents
@@ -185,9 +260,37 @@ class EcosystemModel(Model):
 
   def step(self):
     self.schedule.step()
+    if self.dynamic:
+      self.rewire()
     self.datacollector.collect(self)
+    for monitor in self.monitors:
+      monitor.update(self)
+
+  def attracts(self, node):
+    # prey to eat or a light to gather prey around
+    return any(isinstance(a, (Prey, Lights)) for a in self.grid.get_cell_list_contents([node]))
+
+  def rewire(self):
+    grid = self.grid
+    for agent in self.schedule.agents:
+      if not isinstance(agent, Spider) or agent.pos is None:
+        continue
+      node = agent.pos
+      # abandon a connection that leads to neither prey nor light
+      if self.random.random() < self.rewire_rate:
+        nbr = grid.random_neighbor(node, self.random)
+        if nbr is not None and not self.attracts(nbr):
+          grid.remove_edge(node, nbr)
+      # build a connection towards prey or light two hops away
+      if self.random.random() < self.rewire_rate:
+        mid = grid.random_neighbor(node, self.random)
+        far = grid.random_neighbor(mid, self.random) if mid is not None else None
+        if far is not None and far != node and self.attracts(far):
+          grid.add_edge(node, far)
 
   def plot_network(self):
+      import matplotlib.pyplot as plt
+
       graph = self.G
       pos = nx.spring_layout(graph, seed=42)
 
@@ -215,8 +318,23 @@ class EcosystemModel(Model):
       plt.title("Ecosystem Network Visualization")
       plt.show()
 
+params = {
+    "num_spiders": 300,
+    "num_prey": 100,
+    "num_lights": 18,
+    "spider_fecundity": 0.2,
+    "spider_growth": 1,
+    "prey_survival": 0.1,
+    "lights_luminosity": 5,
+    "width": 10,
+    "height": 10,
+    "steps": 20,
+    "delay": 0.5,
+    "layout": 2
+}
+
 def main():
-  model = EcosystemModel(300, 100, 18, 0.2, 1, 0.1, 5, 10, 10, 20, 0.5, 2)
+  model = EcosystemModel(**params)
   for _i in range(50):
       model.step()
 
@@ -234,12 +352,18 @@ def main():
         sum += 1
     return sum
   # sum(1 for agent in model.schedule.agents if isinstance(agent, Spider))})
-  if __name__ == '__main__':
-    main()
 
-cmap = ListedColormap(["pink", "black", "green",])
+
+# Everything below is visualization. matplotlib and panel are imported inside
+# the functions that need them, so importing this module for the model alone
+# stays cheap and needs no display backend.
+
+state_colors = ["pink", "black", "green"]
 
 def plot_grid(model,fig,layout='spring',title='Ecosystem Network'):
+    from matplotlib.colors import ListedColormap
+
+    cmap = ListedColormap(state_colors)
     graph = model.G
     if layout == 'kamada-kawai':
         pos = nx.kamada_kawai_layout(graph)
@@ -255,21 +379,50 @@ def plot_grid(model,fig,layout='spring',title='Ecosystem Network'):
             alpha=0.9,font_size=14)
     return
 
-#example usage
-fig,ax=plt.subplots(1,1,figsize=(16,10))
-model = EcosystemModel(50, num_prey= 2 , num_lights= 2, spider_fecundity= 2, prey_survival= 2, lights_luminosity= 2 , width=10, height=10, spider_growth= 5, steps= 5, delay= 5, layout= 5)
-model.step()
-f=plot_grid(model,fig,layout='kamada-kawai')
-
-def run_model(num_prey, num_lights, num_spiders, spider_fecundity, prey_survival, lights_luminosity, spider_growth, width, height, steps, delay, layout):
-    model = EcosystemModel(num_lights=num_lights, num_prey=num_prey, num_spiders=num_spiders, prey_survival=prey_survival, lights_luminosity=lights_luminosity, spider_growth=spider_growth, spider_fecundity=spider_fecundity, width=width, height=height, steps=steps, delay=delay, layout=layout)
+def example():
+    import matplotlib.pyplot as plt
+
+    fig,ax=plt.subplots(1,1,figsize=(16,10))
+    model = EcosystemModel(50, num_prey= 2 , num_lights= 2, spider_fecundity= 2, prey_survival= 2, lights_luminosity= 2 , width=10, height=10, spider_growth= 5, steps= 5, delay= 5, layout= 5)
+    model.step()
+    plot_grid(model,fig,layout='kamada-kawai')
+    return fig
+
+# dashboard widgets and figures, filled in by dashboard()
+_ui = {}
+
+def plot_states(model_vars, fig):
+    fig.clf()
+    ax = fig.add_subplot()
+    for name, values in model_vars.items():
+        ax.plot(values, label=name)
+    ax.set_xlabel('step')
+    ax.legend()
+
+def run_model(num_prey, num_lights, num_spiders, spider_fecundity, prey_survival, lights_luminosity, spider_growth, width, height, steps, delay, layout, seed=None, cache=None):
+    import time
+    import matplotlib.pyplot as plt
+
+    params = dict(num_lights=num_lights, num_prey=num_prey, num_spiders=num_spiders, prey_survival=prey_survival, lights_luminosity=lights_luminosity, spider_growth=spider_growth, spider_fecundity=spider_fecundity, width=width, height=height, steps=steps, delay=delay, layout=layout)
+    key = None
+    if cache is not None and seed is not None:
+        key = cache.key('network', params, seed, steps)
+        entry = cache.get(key)
+        if entry is not None:
+            # the same run was done before: show its series, skip the simulation
+            plot_states(entry['model_vars'], _ui['states_fig'])
+            _ui['states_pane'].object = _ui['states_fig']
+            return entry
+
+    model = EcosystemModel(seed=seed, **params)
+    grid_fig = _ui['grid_fig']
 
     fig1 = plt.Figure(figsize=(8,6))
     ax1 = fig1.add_subplot(1,1,1)
-    grid_pane.object = ax1  # Assign the subplot to grid_pane.object
+    _ui['grid_pane'].object = ax1  # Assign the subplot to grid_pane.object
     fig2 = plt.Figure(figsize=(8,6))
     ax2 = fig2.add_subplot(1,1,1)
-    states_pane.object = ax2
+    _ui['states_pane'].object = ax2
 
     # Draw initial grid plot
     plot_grid(model, grid_fig, layout=layout)
@@ -281,8 +434,6 @@ def run_model(num_prey, num_lights, num_spiders, spider_fecundity, prey_survival
     grid_fig.canvas.draw()
     # states_fig.canvas.draw()  # Uncomment this line if you have a separate states plot
 
-    # Step through the model and plot at each step
-
     #step through the model and plot at each step
     for i in range(steps):
         model.step()
@@ -290,40 +441,74 @@ def run_model(num_prey, num_lights, num_spiders, spider_fecundity, prey_survival
         grid_fig.canvas.draw()
         time.sleep(delay)
 
-grid_pane=pn.pane.Matplotlib(plt.Figure(),width=500,height=400)
-states_pane = pn.pane.Matplotlib(plt.Figure(),width=400,height=300)
-go_btn = pnw.Button(name='run',width=100,button_type='primary')
-pop_input = pnw.IntSlider(name='population',value=100,start=10,end=1000,step=10,width=100)
-num_prey_input = pnw.IntSlider(name='num_prey',value=100,start=10,end=200,width=100)
-num_lights_input = pnw.IntSlider(name='num_lights',value=100,start=10,end=200,width=100)
-num_spiders_input = pnw.IntSlider(name='num_spiders',value=100,start=10,end=200,width=100)
-spider_fecundity_input = pnw.IntSlider(name ='spider_fecunidty', value=100, start=10, end=100,width=100)
-lights_luminosity_input = pnw.IntSlider(name ='lights_luminosity', value=100, start=10, end=100, width=100)
-prey_survival_input = pnw.IntSlider(name ='prey_survival', value=100, start=10, end=100, width=100)
-spider_growth_input = pnw.IntSlider(name ='spider_growth', value=100, start=10, end=100, width=100)
-steps_input = pnw.IntSlider(name='steps',value=20,start=5,end=100,width=100)
-delay_input = pnw.FloatSlider(name='delay',value=.2,start=0,end=3,step=.2,width=100)
-layout_input = pnw.Select(name='layout',options=['spring','circular','kamada-kawai'],width=100)
-widgets = pn.WidgetBox(go_btn,pop_input,num_prey_input, num_lights_input,num_spiders_input, spider_fecundity_input, spider_growth_input, lights_luminosity_input, steps_input, delay_input, layout_input)
-
-pn.extension()
-
-grid_fig, grid_ax = plt.subplots(1, 1, figsize=(8, 6))
-states_fig, states_ax = plt.subplots(1, 1, figsize=(8, 6))
+    plot_states(model.datacollector.model_vars, _ui['states_fig'])
+    _ui['states_pane'].object = _ui['states_fig']
+    if key is not None:
+        from Run import summarize
 
+        cache.put(key, model.datacollector.model_vars, summarize(model, 'network', params, seed, steps))
 
 def execute(event):
+    ui = _ui
     # Clear previous plots
-    grid_ax.clear()
-    states_ax.clear()
+    ui['grid_ax'].clear()
+    ui['states_ax'].clear()
     # Run the model
-    run_model(num_prey_input.value, num_lights_input.value, num_spiders_input.value, spider_fecundity_input.value, prey_survival_input.value, lights_luminosity_input.value, spider_growth_input.value, steps_input.value, layout_input.value, delay_input.value)
+    run_model(num_prey=ui['num_prey_input'].value, num_lights=ui['num_lights_input'].value,
+              num_spiders=ui['num_spiders_input'].value, spider_fecundity=ui['spider_fecundity_input'].value,
+              prey_survival=ui['prey_survival_input'].value, lights_luminosity=ui['lights_luminosity_input'].value,
+              spider_growth=ui['spider_growth_input'].value, width=10, height=10,
+              steps=ui['steps_input'].value, delay=ui['delay_input'].value, layout=ui['layout_input'].value,
+              seed=ui['seed_input'].value, cache=ui['cache'])
     # Draw the updated plots
-    grid_fig.canvas.draw()
-    states_fig.canvas.draw()
-
-# Watch the button click event
-go_btn.param.watch(execute, 'clicks')
-
-
-pn.Row(pn.Column(widgets),grid_pane,states_pane,sizing_mode='stretch_width')
+    ui['grid_fig'].canvas.draw()
+    ui['states_fig'].canvas.draw()
+
+def dashboard(cache_dir='.run_cache'):
+    import matplotlib.pyplot as plt
+    import panel as pn
+    from panel import widgets as pnw
+    from RunCache import RunCache
+
+    ui = _ui
+    # repeated seeded runs are answered from here
+    ui['cache'] = RunCache(cache_dir)
+    ui['grid_pane'] = pn.pane.Matplotlib(plt.Figure(),width=500,height=400)
+    ui['states_pane'] = pn.pane.Matplotlib(plt.Figure(),width=400,height=300)
+    ui['go_btn'] = pnw.Button(name='run',width=100,button_type='primary')
+    ui['pop_input'] = pnw.IntSlider(name='population',value=100,start=10,end=1000,step=10,width=100)
+    ui['num_prey_input'] = pnw.IntSlider(name='num_prey',value=100,start=10,end=200,width=100)
+    ui['num_lights_input'] = pnw.IntSlider(name='num_lights',value=100,start=10,end=200,width=100)
+    ui['num_spiders_input'] = pnw.IntSlider(name='num_spiders',value=100,start=10,end=200,width=100)
+    ui['spider_fecundity_input'] = pnw.IntSlider(name ='spider_fecunidty', value=100, start=10, end=100,width=100)
+    ui['lights_luminosity_input'] = pnw.IntSlider(name ='lights_luminosity', value=100, start=10, end=100, width=100)
+    ui['prey_survival_input'] = pnw.IntSlider(name ='prey_survival', value=100, start=10, end=100, width=100)
+    ui['spider_growth_input'] = pnw.IntSlider(name ='spider_growth', value=100, start=10, end=100, width=100)
+    ui['steps_input'] = pnw.IntSlider(name='steps',value=20,start=5,end=100,width=100)
+    ui['delay_input'] = pnw.FloatSlider(name='delay',value=.2,start=0,end=3,step=.2,width=100)
+    ui['layout_input'] = pnw.Select(name='layout',options=['spring','circular','kamada-kawai'],width=100)
+    ui['seed_input'] = pnw.IntInput(name='seed',value=0,width=100)
+    widgets = pn.WidgetBox(ui['go_btn'], ui['pop_input'], ui['num_prey_input'], ui['num_lights_input'],
+                           ui['num_spiders_input'], ui['spider_fecundity_input'], ui['spider_growth_input'],
+                           ui['lights_luminosity_input'], ui['steps_input'], ui['delay_input'], ui['layout_input'],
+                           ui['seed_input'])
+
+    pn.extension()
+
+    ui['grid_fig'], ui['grid_ax'] = plt.subplots(1, 1, figsize=(8, 6))
+    ui['states_fig'], ui['states_ax'] = plt.subplots(1, 1, figsize=(8, 6))
+
+    # Watch the button click event
+    ui['go_btn'].param.watch(execute, 'clicks')
+
+    return pn.Row(pn.Column(widgets),ui['grid_pane'],ui['states_pane'],sizing_mode='stretch_width')
+
+def app():
+    dashboard().show()
+
+
+if __name__ == '__main__':
+    app()
+elif __name__.startswith('bokeh'):
+    # `panel serve Network.py`
+    dashboard().servable()
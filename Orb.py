@@ -4,8 +4,13 @@ from mesa.datacollection import DataCollector
 from mesa.space import MultiGrid
 from mesa.time import RandomActivation
 from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid, ChartModule
+from mesa.visualization.modules import ChartModule
 from mesa.visualization.UserParam import Slider
+from SparseGrid import SparseMultiGrid
+from Detectors import EarlyStopping
+from Fitting import OnlineLotkaVolterra
+from Density import DensityGrid
+from Scheduling import TypeStagedActivation
 from random import Random
 
 n_ecosystem_starts = 0
@@ -24,6 +29,11 @@ class Spider(Agent):
         self.move()
         print('between move and grow, pos:', self.pos)
         self.grow()
+        if self.pos is None:
+            return  # died of old age in grow()
+        self.interact()
+
+    def interact(self):
         print('ABOUT:self(spider).model.grid.get_cell_list_contents(',
               self.pos, ')')
         lights_in_cells = self.model.grid.get_cell_list_contents([self.pos])
@@ -146,13 +156,28 @@ class Environment(MultiGrid):
 
 class EcosystemModel(Model):
     def __init__(self, num_spiders, num_prey, num_lights, spider_fecundity, spider_growth,
-                 prey_survival, lights_luminosity, width, height):
+                 prey_survival, lights_luminosity, width, height, sparse=False,
+                 early_stop=False, fit_dynamics=False, scheduler="random",
+                 seed=None):
+        # seed is consumed by mesa's Model.__new__ to seed self.random
         super().__init__()
         global n_ecosystem_starts
         print('before: n_ecosystem_starts:', n_ecosystem_starts)
         n_ecosystem_starts += 1
-        self.schedule = RandomActivation(self)
-        self.grid = Environment(width, height, True)
+        if scheduler == "staged":
+            # all prey move, then spiders move and feed, grow and reproduce,
+            # then meet the lights; Lights are static and never activated
+            self.schedule = TypeStagedActivation(self, [(Prey, "step"),
+                                                        (Spider, "move"),
+                                                        (Spider, "grow"),
+                                                        (Spider, "interact")])
+        else:
+            self.schedule = RandomActivation(self)
+        if sparse:
+            # only occupied cells are stored, for huge mostly-empty worlds
+            self.grid = SparseMultiGrid(width, height, True)
+        else:
+            self.grid = Environment(width, height, True)
         self.num_spiders = num_spiders
         self.num_prey = num_prey
         self.num_lights = num_lights
@@ -160,9 +185,17 @@ class EcosystemModel(Model):
         self.spider_growth = spider_growth
         self.prey_survival = prey_survival
         self.lights_luminosity = lights_luminosity
-        self.datacollector = DataCollector(agent_reporters={"Spiders": spider_sum,
-                                                            "Prey": prey_sum
-                                                            })
+        self.datacollector = DataCollector(
+            model_reporters={"Spiders": lambda m: len([agent for agent in m.schedule.agents if isinstance(agent, Spider)]),
+                             "Prey": lambda m: len([agent for agent in m.schedule.agents if isinstance(agent, Prey)])
+                             })
+        self.stop_reason = None
+        self.dynamics = None
+        self.monitors = []
+        if fit_dynamics:
+            self.monitors.append(OnlineLotkaVolterra())
+        if early_stop:
+            self.monitors.append(EarlyStopping(series=("Spiders", "Prey")))
         # self.datacollector = DataCollector(agent_reporters={"Spiders": lambda m: sum(1 for agent in m.schedule.agents if isinstance(agent, Spider))})
 
         for _i in range(self.num_spiders):
@@ -187,6 +220,8 @@ class EcosystemModel(Model):
         print("Ecosystem Step called")
         self.schedule.step()
         self.datacollector.collect(self)
+        for monitor in self.monitors:
+            monitor.update(self)
 
 
 params = {
@@ -228,15 +263,18 @@ def agent_portrayal(agent):
 
 
 def main():
-    grid = CanvasGrid(agent_portrayal,
-                      params["width"], params["height"],
-                      20*params["width"], 20*params["height"])
+    # individual agents while zoomed in, a density heatmap for large views
+    grid = DensityGrid(agent_portrayal,
+                       params["width"], params["height"],
+                       20*params["width"], 20*params["height"],
+                       species_colors={"Spider": "green", "Prey": "blue", "Lights": "yellow"})
     chart = ChartModule([{"Label": "Spiders", "Color": "green"}], 
                         data_collector_name="datacollector")
     server = ModularServer(EcosystemModel,
                            [grid, chart],
                            "Ecosystem Model",
                            model_params=params)
+    grid.install(server)
     server.launch()
 
 def spider_sum(agent):
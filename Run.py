@@ -0,0 +1,167 @@
+"""Headless runner for the EcosystemModel variants.
+
+    python3 Run.py orb --steps 200 --seed 1 --param num_spiders=50 --out results/orb
+
+runs a model without the web server or any plotting and writes the collected
+time series and a summary.json to the output directory.
+"""
+import argparse
+import ast
+import contextlib
+import importlib
+import json
+import os
+import time
+
+from Metrics import MetricsExporter
+from RunCache import RunCache
+
+variants = {
+    "orb": "Orb",
+    "update": "Update",
+    "network": "Network",
+}
+
+
+def default_params(variant):
+    module = importlib.import_module(variants[variant])
+    # Orb/Update keep their defaults in sliders, Network in plain values
+    return {name: getattr(value, "value", value) for name, value in module.params.items()}
+
+
+def run(variant, steps, seed=None, params=None, verbose=False, early_stop=False, metrics=None):
+    module = importlib.import_module(variants[variant])
+    kwargs = default_params(variant)
+    kwargs.update(params or {})
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            # the models print on every agent step, which dominates headless runs
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        model = module.EcosystemModel(seed=seed, early_stop=early_stop, **kwargs)
+        if metrics is not None:
+            metrics.attach(model)
+        for _i in range(steps):
+            if not model.running:
+                break
+            model.step()
+    return model, kwargs
+
+
+def summarize(model, variant, params, seed, steps):
+    model_vars = model.datacollector.model_vars
+    return {
+        "variant": variant,
+        "params": params,
+        "seed": seed,
+        "steps": steps,
+        "steps_run": model.schedule.steps,
+        "stop_reason": getattr(model, "stop_reason", None),
+        "dynamics": getattr(model, "dynamics", None),
+        "final": {name: values[-1] for name, values in model_vars.items() if values},
+    }
+
+
+def cached_run(cache, variant, steps, seed=None, params=None, verbose=False, early_stop=False,
+               metrics=None):
+    """Like run(), but answered from cache when the same run was done before.
+
+    Returns (model_vars, summary, model); model is None on a cache hit.
+    Unseeded runs are never cached since they cannot be reproduced.
+    """
+    full_params = default_params(variant)
+    full_params.update(params or {})
+    key = None
+    if seed is not None:
+        key = cache.key(variant, full_params, seed, steps, early_stop)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["model_vars"], entry["summary"], None
+    model, full_params = run(variant, steps, seed=seed, params=params, verbose=verbose,
+                             early_stop=early_stop, metrics=metrics)
+    model_vars = model.datacollector.model_vars
+    summary = summarize(model, variant, full_params, seed, steps)
+    if key is not None:
+        cache.put(key, model_vars, summary)
+    return model_vars, summary, model
+
+
+def write_results(model_vars, out_dir, summary):
+    import pandas as pd
+
+    os.makedirs(out_dir, exist_ok=True)
+    pd.DataFrame(model_vars).to_csv(os.path.join(out_dir, "model_vars.csv"))
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+def parse_param(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected name=value, got {text!r}")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass  # keep it as a string
+    return name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an EcosystemModel variant headless.")
+    parser.add_argument("variant", choices=sorted(variants))
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--param", type=parse_param, action="append", default=[],
+                        metavar="NAME=VALUE", help="model parameter, may be repeated")
+    parser.add_argument("--out", default="results", help="output directory")
+    parser.add_argument("--early-stop", action="store_true",
+                        help="stop on extinction, steady state or cycles")
+    parser.add_argument("--fit-dynamics", action="store_true",
+                        help="fit Lotka-Volterra parameters online while the model runs")
+    parser.add_argument("--verbose", action="store_true", help="keep the models' console output")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", default=None,
+                        help="rewrite Prometheus metrics to this file periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="seconds between metrics file dumps")
+    parser.add_argument("--cache", default=None,
+                        help="directory of cached runs; seeded runs are looked up there first")
+    parser.add_argument("--cache-size", type=float, default=512,
+                        help="cache size limit in MB")
+    args = parser.parse_args(argv)
+
+    metrics = None
+    if args.metrics_port is not None or args.metrics_file:
+        metrics = MetricsExporter()
+        if args.metrics_port is not None:
+            metrics.serve(args.metrics_port)
+        if args.metrics_file:
+            metrics.dump_every(args.metrics_file, args.metrics_interval)
+
+    params = dict(args.param)
+    if args.fit_dynamics:
+        params["fit_dynamics"] = True  # a model parameter, so it is part of the cache key
+    start = time.perf_counter()
+    options = dict(params=params, verbose=args.verbose, early_stop=args.early_stop,
+                   metrics=metrics)
+    if args.cache:
+        cache = RunCache(args.cache, max_bytes=int(args.cache_size * 2**20))
+        model_vars, summary, model = cached_run(cache, args.variant, args.steps, seed=args.seed,
+                                                **options)
+    else:
+        model, params = run(args.variant, args.steps, seed=args.seed, **options)
+        model_vars = model.datacollector.model_vars
+        summary = summarize(model, args.variant, params, args.seed, args.steps)
+    summary["cached"] = model is None
+    summary["wall_time"] = time.perf_counter() - start
+    write_results(model_vars, args.out, summary)
+    if metrics is not None:
+        if args.metrics_file:
+            metrics.dump(args.metrics_file)  # final values
+        metrics.close()
+    source = " (cached)" if summary["cached"] else ""
+    print(f"{args.variant}: {summary['steps_run']} steps{source} in {summary['wall_time']:.2f}s -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Content-addressed on-disk cache of finished model runs.
+
+A run is keyed on a hash of its variant, full parameter set, seed, step count
+and the model version (the source of the files that define the simulation plus
+the mesa version). The entry holds the collected model time series and the run
+summary. Entries are evicted least-recently-used once the cache grows past
+max_bytes.
+"""
+import hashlib
+import json
+import os
+
+import mesa
+
+# modules whose code changes what a run produces; Run.py shapes the summary
+model_files = {
+    "orb": ["Orb.py"],
+    "update": ["Update.py"],
+    "network": ["Network.py"],
+}
+shared_files = ["SparseGrid.py", "Detectors.py", "Scheduling.py", "Fitting.py", "Run.py"]
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def model_version(variant):
+    digest = hashlib.sha256(mesa.__version__.encode())
+    for name in model_files[variant] + shared_files:
+        with open(os.path.join(here, name), "rb") as f:
+            digest.update(name.encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class RunCache:
+    def __init__(self, directory, max_bytes=512 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._versions = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, variant, params, seed, steps, early_stop=False):
+        if variant not in self._versions:
+            self._versions[variant] = model_version(variant)
+        spec = {"variant": variant, "params": params, "seed": seed, "steps": steps,
+                "early_stop": early_stop, "version": self._versions[variant]}
+        return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # mark as recently used
+        return entry
+
+    def put(self, key, model_vars, summary):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"model_vars": model_vars, "summary": summary}, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue  # removed by another process
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _mtime, size, _name in entries)
+        for _mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,47 @@
+import weakref
+from collections import defaultdict
+
+from mesa.time import BaseScheduler
+
+
+class TypeStagedActivation(BaseScheduler):
+    """Keeps agents bucketed by class and runs a step as a list of stages.
+
+    stages is a list of (agent class, method name) pairs, e.g.
+    [(Prey, "step"), (Spider, "move"), (Spider, "grow")]. Each stage shuffles
+    only its own bucket and calls the method on every agent that was scheduled
+    when the step began and still is, so there is no per-agent isinstance dispatch and classes that appear in no
+    stage (static Lights) cost nothing. Like mesa's AgentSet the buckets hold
+    weak references, so agents dropped from the model disappear on their own.
+    """
+
+    def __init__(self, model, stages):
+        super().__init__(model)
+        self.stages = stages
+        self.buckets = defaultdict(weakref.WeakKeyDictionary)
+
+    def add(self, agent):
+        super().add(agent)
+        self.buckets[type(agent)][agent] = None
+
+    def remove(self, agent):
+        super().remove(agent)
+        self.buckets[type(agent)].pop(agent, None)
+
+    def get_type_count(self, agent_class):
+        return len(self.buckets[agent_class])
+
+    def step(self):
+        # like AgentSet.do, agents added during the step wait for the next one
+        snapshot = {agent_class: list(self.buckets[agent_class].keyrefs())
+                    for agent_class, _method in self.stages}
+        for agent_class, method in self.stages:
+            bucket = self.buckets[agent_class]
+            refs = list(snapshot[agent_class])
+            self.model.random.shuffle(refs)
+            for ref in refs:
+                agent = ref()
+                if agent is not None and agent in bucket:
+                    getattr(agent, method)()
+        self.steps += 1
+        self.time += 1
@@ -0,0 +1,136 @@
+from itertools import chain
+
+
+class SparseMultiGrid:
+    """MultiGrid look-alike that only stores occupied cells.
+
+    Cells live in fixed-size square tiles that are created the first time an
+    agent lands in them and dropped again as soon as they are empty, so a huge
+    mostly-empty world costs memory proportional to the number of occupied
+    cells instead of width * height.
+    """
+
+    def __init__(self, width, height, torus, tile_size=64):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.tile_size = tile_size
+        self._tiles = {}  # (tx, ty) -> {(x, y): [agents]}
+        self._num_cells = 0  # occupied cells
+
+    def _tile_key(self, pos):
+        return pos[0] // self.tile_size, pos[1] // self.tile_size
+
+    def _cell(self, pos):
+        tile = self._tiles.get(self._tile_key(pos))
+        if tile is None:
+            return None
+        return tile.get(pos)
+
+    def out_of_bounds(self, pos):
+        if pos is not None:
+            x, y = pos
+            return x < 0 or x >= self.width or y < 0 or y >= self.height
+        else:
+            return True  # Return True if pos is None
+
+    def torus_adj(self, pos):
+        if not self.out_of_bounds(pos):
+            return pos
+        elif not self.torus:
+            raise Exception("Point out of bounds, and space non-toroidal.")
+        else:
+            return pos[0] % self.width, pos[1] % self.height
+
+    def place_agent(self, agent, pos):
+        key = self._tile_key(pos)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = self._tiles[key] = {}
+        cell = tile.get(pos)
+        if cell is None:
+            cell = tile[pos] = []
+            self._num_cells += 1
+        if agent.pos is None or agent not in cell:
+            cell.append(agent)
+        agent.pos = pos
+
+    def remove_agent(self, agent):
+        pos = agent.pos
+        if pos is None:
+            return
+        key = self._tile_key(pos)
+        tile = self._tiles[key]
+        cell = tile[pos]
+        cell.remove(agent)
+        if not cell:
+            # free the cell, and the whole tile once nothing is left in it
+            del tile[pos]
+            self._num_cells -= 1
+            if not tile:
+                del self._tiles[key]
+        agent.pos = None
+
+    def move_agent(self, agent, pos):
+        pos = self.torus_adj(pos)
+        self.remove_agent(agent)
+        self.place_agent(agent, pos)
+
+    def iter_neighborhood(self, pos, moore, include_center=False, radius=1):
+        x, y = pos
+        seen = set()
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if dx == 0 and dy == 0 and not include_center:
+                    continue
+                if not moore and abs(dx) + abs(dy) > radius:
+                    continue
+                px, py = x + dx, y + dy
+                if self.out_of_bounds((px, py)):
+                    if not self.torus:
+                        continue
+                    px, py = px % self.width, py % self.height
+                if (px, py) not in seen:
+                    seen.add((px, py))
+                    yield px, py
+
+    def get_neighborhood(self, pos, moore, include_center=False, radius=1):
+        return list(self.iter_neighborhood(pos, moore, include_center, radius))
+
+    def iter_cell_list_contents(self, cell_list):
+        if isinstance(cell_list, tuple) and len(cell_list) == 2 \
+                and isinstance(cell_list[0], int):
+            cell_list = [cell_list]  # a single (x, y) was passed
+        cells = (self._cell(pos) for pos in cell_list)
+        return chain.from_iterable(cell for cell in cells if cell)
+
+    def get_cell_list_contents(self, cell_list):
+        return list(self.iter_cell_list_contents(cell_list))
+
+    def iter_neighbors(self, pos, moore, include_center=False, radius=1):
+        return self.iter_cell_list_contents(
+            self.iter_neighborhood(pos, moore, include_center, radius))
+
+    def get_neighbors(self, pos, moore, include_center=False, radius=1):
+        return list(self.iter_neighbors(pos, moore, include_center, radius))
+
+    def is_cell_empty(self, pos):
+        return not self._cell(pos)
+
+    def exists_empty_cells(self):
+        return self._num_cells < self.width * self.height
+
+    def coord_iter(self):
+        # only occupied cells are visited, unlike MultiGrid.coord_iter
+        for tile in list(self._tiles.values()):
+            for pos, cell in list(tile.items()):
+                yield cell, pos
+
+    def __iter__(self):
+        for tile in self._tiles.values():
+            for cell in tile.values():
+                yield cell
+
+    @property
+    def num_tiles(self):
+        return len(self._tiles)
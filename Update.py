@@ -5,8 +5,13 @@ from mesa.datacollection import DataCollector
 from mesa.space import MultiGrid
 from mesa.time import RandomActivation
 from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules import CanvasGrid, ChartModule
+from mesa.visualization.modules import ChartModule
 from mesa.visualization.UserParam import Slider
+from SparseGrid import SparseMultiGrid
+from Detectors import EarlyStopping
+from Fitting import OnlineLotkaVolterra
+from Density import DensityGrid
+from Scheduling import TypeStagedActivation
 
 
 n_ecosystem_starts = 0
@@ -25,6 +30,11 @@ class Spider(Agent):
         self.move()
         print('between move and grow, pos:', self.pos)
         self.grow()
+        if self.pos is None:
+            return  # died of old age in grow()
+        self.interact()
+
+    def interact(self):
         print('ABOUT:self(spider).model.grid.get_cell_list_contents(',
               self.pos, ')')
         lights_in_cells = self.model.grid.get_cell_list_contents([self.pos])
@@ -164,13 +174,28 @@ class Environment(MultiGrid):
 
 class EcosystemModel(Model):
     def __init__(self, num_spiders, num_prey, num_lights, spider_fecundity, spider_growth,
-                 prey_survival, lights_luminosity, width, height):
+                 prey_survival, lights_luminosity, width, height, sparse=False,
+                 early_stop=False, fit_dynamics=False, scheduler="random",
+                 seed=None):
+        # seed is consumed by mesa's Model.__new__ to seed self.random
         super().__init__()
         global n_ecosystem_starts
         print('before: n_ecosystem_starts:', n_ecosystem_starts)
         n_ecosystem_starts += 1
-        self.schedule = RandomActivation(self)
-        self.grid = Environment(width, height, True)
+        if scheduler == "staged":
+            # all prey move, then spiders move and feed, grow and reproduce,
+            # then meet the lights; Lights are static and never activated
+            self.schedule = TypeStagedActivation(self, [(Prey, "step"),
+                                                        (Spider, "move"),
+                                                        (Spider, "grow"),
+                                                        (Spider, "interact")])
+        else:
+            self.schedule = RandomActivation(self)
+        if sparse:
+            # only occupied cells are stored, for huge mostly-empty worlds
+            self.grid = SparseMultiGrid(width, height, True)
+        else:
+            self.grid = Environment(width, height, True)
         self.num_spiders = num_spiders
         self.num_prey = num_prey
         self.num_lights = num_lights
@@ -184,6 +209,14 @@ class EcosystemModel(Model):
             "Lights": lambda m: len([agent for agent in m.schedule.agents if isinstance(agent, Lights)])
            }
        )
+        self.stop_reason = None
+        self.dynamics = None
+        self.monitors = []
+        if fit_dynamics:
+            self.monitors.append(OnlineLotkaVolterra())
+        if early_stop:
+            self.monitors.append(EarlyStopping(series=("Spiders", "Prey", "Lights")))
+
         for _i in range(self.num_spiders):
             x = self.random.randrange(self.grid.width)
             y = self.random.randrange(self.grid.height)
@@ -215,6 +248,8 @@ class EcosystemModel(Model):
         print("Ecosystem Step called")
         self.schedule.step()
         self.datacollector.collect(self)
+        for monitor in self.monitors:
+            monitor.update(self)
 
 
 params = {
@@ -258,9 +293,11 @@ def agent_portrayal(agent):
 
 
 def main():
-    grid = CanvasGrid(agent_portrayal,
-                      params["width"], params["height"],
-                      20*params["width"], 20*params["height"])
+    # individual agents while zoomed in, a density heatmap for large views
+    grid = DensityGrid(agent_portrayal,
+                       params["width"], params["height"],
+                       20*params["width"], 20*params["height"],
+                       species_colors={"Spider": "green", "Prey": "blue", "Lights": "yellow"})
     chart = ChartModule([{"Label": "Spiders",
        "Color": "green"}],
      data_collector_name='datacollector')
@@ -274,6 +311,7 @@ def main():
                            [grid, chart, chart_1, chart_2],
                            "Ecosystem Model",
                            model_params=params)
+    grid.install(server)
     server.launch()
 
 
@@ -0,0 +1,92 @@
+"""Checks of the Ensemble queue with several local workers.
+
+    python3 -m pytest -q test_ensemble.py
+"""
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import Ensemble
+
+spec = {"variant": "network", "steps": 2, "params": {"num_spiders": 10, "num_prey": 10,
+                                                      "num_lights": 5}}
+
+
+def job_row(queue, job_id):
+    conn = sqlite3.connect(queue)
+    row = conn.execute("SELECT status, worker, attempts FROM jobs WHERE id = ?",
+                       (job_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def test_local_workers_drain_the_queue(tmp_path):
+    queue, results = str(tmp_path / "runs.db"), str(tmp_path / "results")
+    Ensemble.enqueue(queue, [dict(spec, seed=seed) for seed in range(6)])
+    workers = [multiprocessing.Process(target=Ensemble.work, args=(queue, results),
+                                       kwargs={"poll": 0.1})
+               for _i in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+    assert Ensemble.status(queue) == {"done": 6}
+    assert sorted(os.listdir(results)) == [f"job-{i}" for i in range(1, 7)]
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue, results = str(tmp_path / "runs.db"), str(tmp_path / "results")
+    Ensemble.enqueue(queue, [dict(spec, seed=0)])
+    stuck = Ensemble.Worker(queue, results, lease=0.2)
+    stuck.name = "stuck"
+    job_id, _spec = stuck.claim()
+    time.sleep(0.3)  # stuck never renews its lease
+
+    live = Ensemble.Worker(queue, results, lease=30)
+    live.name = "live"
+    assert live.claim()[0] == job_id
+    assert job_row(queue, job_id) == ("running", "live", 2)
+
+    # the late worker must not finish or fail a job it no longer owns
+    stuck.finish(job_id)
+    assert job_row(queue, job_id) == ("running", "live", 2)
+    stuck.finish(job_id, "boom")
+    assert job_row(queue, job_id) == ("running", "live", 2)
+
+    live.process(job_id, dict(spec, seed=0))
+    assert job_row(queue, job_id)[0] == "done"
+    assert os.listdir(results) == [f"job-{job_id}"]
+
+
+def test_failed_run_is_retried_then_failed(tmp_path):
+    queue, results = str(tmp_path / "runs.db"), str(tmp_path / "results")
+    Ensemble.enqueue(queue, [dict(spec, variant="network", params={"no_such_param": 1})])
+    Ensemble.Worker(queue, results, max_attempts=2, poll=0.1).work(exit_when_empty=True)
+    assert job_row(queue, 1)[::2] == ("failed", 2)
+    assert os.listdir(results) == []
+
+
+def test_renew_survives_a_locked_database(tmp_path, monkeypatch):
+    queue, results = str(tmp_path / "runs.db"), str(tmp_path / "results")
+    Ensemble.enqueue(queue, [dict(spec, seed=0)])
+    worker = Ensemble.Worker(queue, results, lease=0.6)
+    job_id, _spec = worker.claim()
+    connect = Ensemble.connect
+    monkeypatch.setattr(Ensemble, "connect",
+                        lambda path: sqlite3.connect(path, timeout=0.05, isolation_level=None))
+
+    blocker = connect(queue)
+    blocker.execute("BEGIN EXCLUSIVE")
+    stop = Ensemble.threading.Event()
+    heartbeat = Ensemble.threading.Thread(target=worker.renew, args=(job_id, stop))
+    heartbeat.start()
+    time.sleep(0.5)  # renewals fail with "database is locked"
+    blocker.execute("ROLLBACK")
+    time.sleep(0.3)
+    assert heartbeat.is_alive()
+    lease_until, = blocker.execute("SELECT lease_until FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+    stop.set()
+    heartbeat.join()
+    assert lease_until > time.time()